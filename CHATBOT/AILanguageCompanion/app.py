@@ -1,9 +1,20 @@
 import streamlit as st
 import openai
 import pandas as pd
+import numpy as np
 import plotly.express as px
+import plotly.graph_objects as go
+import fastexcel
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
 from io import BytesIO
+import hashlib
 import os
+import re
+import tempfile
+from collections import deque
+from config import Config
 from utils import DataUtils
 from visualization import ChartGenerator
 
@@ -17,15 +28,96 @@ st.set_page_config(
 
 # Initialize session state
 if 'messages' not in st.session_state:
-    st.session_state.messages = []
+    st.session_state.messages = deque(maxlen=Config.MAX_CHAT_MESSAGES)
+if 'chart_counter' not in st.session_state:
+    st.session_state.chart_counter = 0
 if 'df' not in st.session_state:
     st.session_state.df = None
+if 'table' not in st.session_state:
+    st.session_state.table = None
+if 'file_hash' not in st.session_state:
+    st.session_state.file_hash = None
+if 'revenue' not in st.session_state:
+    st.session_state.revenue = None
+if 'describe' not in st.session_state:
+    st.session_state.describe = None
+if 'answers' not in st.session_state:
+    st.session_state.answers = {}
+if 'col_lower' not in st.session_state:
+    st.session_state.col_lower = {}
 if 'uploaded_file_name' not in st.session_state:
     st.session_state.uploaded_file_name = None
 if 'available_products' not in st.session_state:
     st.session_state.available_products = []
+if 'available_products_lower' not in st.session_state:
+    st.session_state.available_products_lower = []
+
+# Aggregations are pure functions of the uploaded workbook, so they are cached
+# per file hash; leading-underscore arguments are excluded from Streamlit's hashing.
+def _group_sum(table, key, value_col, values):
+    """Multi-threaded Arrow hash aggregate of values by key, dropping null keys like pandas groupby."""
+    grouped = (
+        table.select([key])
+        .append_column(value_col, pa.array(values, from_pandas=True))
+        .filter(pc.is_valid(table[key]))
+        .group_by(key)
+        .aggregate([(value_col, "sum")])
+    )
+    return grouped.select([key, f"{value_col}_sum"]).rename_columns([key, value_col]).to_pandas(types_mapper=pd.ArrowDtype)
+
+@st.cache_data(max_entries=64)
+def _revenue_by_product(file_hash, _table, _revenue):
+    """Total revenue per product."""
+    return _group_sum(_table, 'Product', 'Revenue', _revenue)
+
+@st.cache_data(max_entries=64)
+def _quantity_by_region(file_hash, _table):
+    """Total quantity per region."""
+    return _group_sum(_table, 'Region', 'Quantity', _table['Quantity'])
+
+@st.cache_data(max_entries=64)
+def _daily_quantity(file_hash, _df):
+    """Sum Quantity per calendar day using integer day keys instead of Python date objects."""
+    days = _df['Date'].to_numpy(dtype='datetime64[ns]', na_value=np.datetime64('NaT')).astype('datetime64[D]')
+    quantity = _df['Quantity'].to_numpy(dtype='float64', na_value=np.nan)
+
+    # Match groupby semantics: rows without a date are dropped, missing quantities count as 0
+    valid = ~np.isnat(days)
+    day_numbers = days[valid].astype('int64')
+    first_day = day_numbers.min() if len(day_numbers) else 0
+    
+    # Day offsets are dense integer group codes, so no sort/unique pass is needed;
+    # datetime64[ns] bounds the span to ~215k days
+    codes = day_numbers - first_day
+    counts = np.bincount(codes)
+    sums = np.bincount(codes, weights=np.nan_to_num(quantity[valid]), minlength=len(counts))
+    present = np.flatnonzero(counts)
+    keys = (present + first_day).astype('datetime64[D]')
+    sums = sums[present]
+
+    if pd.api.types.is_integer_dtype(_df['Quantity']):
+        sums = sums.astype('int64')
+    return pd.DataFrame({'Date': keys, 'Quantity': sums})
 
 class ExcelChatbot:
+    # Keywords the rule-based dispatcher branches on. The lookahead lets one
+    # finditer pass report overlapping hits such as "by product" and "product".
+    QUERY_KEYWORDS = (
+        "product", "revenue", "total", "by product", "quantity", "highest",
+        "by region", "region", "date", "day", "daily", "average", "mean",
+        "how many", "plot", "chart", "graph", "visualize"
+    )
+    _KEYWORD_RE = re.compile(
+        "(?=(" + "|".join(re.escape(k) for k in sorted(QUERY_KEYWORDS, key=len, reverse=True)) + "))"
+    )
+    VISUALIZATION_KEYWORDS = frozenset({"plot", "chart", "graph", "visualize"})
+    TIME_KEYWORDS = frozenset({"date", "day", "daily"})
+    ANSWER_CACHE_SIZE = 256
+    
+    # Bump whenever _parse_excel's output changes so older cached tables are ignored
+    PARSE_CACHE_VERSION = 2
+    PARSE_CACHE_MAX_FILES = 32
+    
     def __init__(self):
         self.utils = DataUtils()
         self.chart_gen = ChartGenerator()
@@ -33,80 +125,212 @@ class ExcelChatbot:
     def load_excel(self, file):
         """Load and process the uploaded Excel file."""
         try:
-            df = pd.read_excel(file)
+            file_hash = self._file_hash(file)
+            cache_path = os.path.join(Config.CACHE_DIR, f"{file_hash}.v{self.PARSE_CACHE_VERSION}.feather")
             
-            # Basic data cleaning
-            df = df.dropna(how='all')
-            df.columns = df.columns.str.strip()
+            if os.path.exists(cache_path):
+                # Re-uploads of the same workbook skip parsing entirely
+                table = feather.read_table(cache_path, memory_map=True)
+                try:
+                    os.utime(cache_path)  # Recently used tables are pruned last
+                except OSError:
+                    pass
+            else:
+                table = self._parse_excel(file)
+                self._write_cache(table, cache_path)
             
-            # Convert date columns if detected
-            for col in df.columns:
-                if 'date' in col.lower():
-                    df[col] = pd.to_datetime(df[col], errors='coerce')
+            df = table.to_pandas(types_mapper=pd.ArrowDtype, split_blocks=True)
+            
+            # Product filters compare integer category codes instead of strings
+            if 'Product' in df.columns:
+                df['Product'] = df['Product'].astype('category')
             
             st.session_state.df = df
+            st.session_state.table = table
+            st.session_state.file_hash = file_hash
+            st.session_state.revenue = None
+            st.session_state.describe = None
+            st.session_state.answers = {}
+            col_lower = {}
+            for col in df.columns:
+                col_lower.setdefault(str(col).lower(), col)
+            st.session_state.col_lower = col_lower
             st.session_state.available_products = df['Product'].unique().tolist() if 'Product' in df.columns else []
+            st.session_state.available_products_lower = [str(p).lower() for p in st.session_state.available_products]
             return True, "File loaded successfully"
             
         except Exception as e:
             return False, f"Error loading file: {str(e)}"
     
+    def _parse_excel(self, file):
+        """Parse the first sheet and apply basic cleaning, returning an Arrow table."""
+        # fastexcel decodes the sheet in Rust straight into Arrow buffers,
+        # so no per-cell Python objects are created on the way in
+        reader = fastexcel.read_excel(file.getvalue())
+        table = pa.Table.from_batches([reader.load_sheet(0).to_arrow()])
+        df = table.to_pandas(types_mapper=pd.ArrowDtype, split_blocks=True, self_destruct=True)
+        del table
+        
+        # Basic data cleaning
+        df = df.dropna(how='all')
+        df.columns = df.columns.str.strip()
+        
+        # Convert date columns if detected
+        date_cols = df.columns[df.columns.str.contains('date', case=False, regex=False, na=False)]
+        if len(date_cols) > 0:
+            df[date_cols] = df[date_cols].apply(pd.to_datetime, errors='coerce')
+        
+        df = self._downcast_numeric(df)
+        return pa.Table.from_pandas(df, preserve_index=False)
+    
+    @staticmethod
+    def _downcast_numeric(df):
+        """Narrow numeric columns to 32 bits when that loses no precision."""
+        for col in df.select_dtypes('number').columns:
+            s = df[col]
+            original = s.to_numpy(dtype='float64', na_value=np.nan)
+            present = original[~np.isnan(original)]
+            # Excel stores every number as a double; whole-number columns become integers
+            if pd.api.types.is_integer_dtype(s) or np.array_equal(present, np.round(present)):
+                target = 'int32[pyarrow]'
+            else:
+                target = 'float[pyarrow]'
+            try:
+                narrowed = s.astype(target)
+            except (TypeError, ValueError, pa.ArrowInvalid):
+                # Values outside the int32 range stay 64-bit
+                continue
+            # Keep the narrow type only if every value survives the round trip exactly
+            if np.array_equal(narrowed.to_numpy(dtype='float64', na_value=np.nan), original, equal_nan=True):
+                df[col] = narrowed
+        return df
+    
+    @staticmethod
+    def _file_hash(file):
+        """Content hash of the uploaded file, used as the parse-cache key."""
+        return hashlib.blake2b(file.getbuffer(), digest_size=16).hexdigest()
+    
+    @classmethod
+    def _write_cache(cls, table, cache_path):
+        """Persist a parsed table as Feather; caching is best-effort."""
+        tmp_path = None
+        try:
+            cache_dir = os.path.dirname(cache_path)
+            os.makedirs(cache_dir, exist_ok=True)
+            # Sessions are threads of one process, so each write needs its own temp file
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+            os.close(fd)
+            feather.write_feather(table, tmp_path, compression="zstd")
+            os.replace(tmp_path, cache_path)
+            tmp_path = None
+            cls._prune_cache(cache_dir)
+        except OSError:
+            pass
+        finally:
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+    
+    @classmethod
+    def _prune_cache(cls, cache_dir):
+        """Delete tables from older parser versions and all but the newest PARSE_CACHE_MAX_FILES."""
+        suffix = f".v{cls.PARSE_CACHE_VERSION}.feather"
+        current = []
+        for entry in os.scandir(cache_dir):
+            if not entry.name.endswith(".feather"):
+                continue
+            try:
+                if entry.name.endswith(suffix):
+                    current.append((entry.stat().st_mtime, entry.path))
+                else:
+                    os.remove(entry.path)
+            except OSError:
+                continue
+        current.sort(reverse=True)
+        for _, path in current[cls.PARSE_CACHE_MAX_FILES:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
     def process_query(self, query):
         """Process user query and generate response."""
         df = st.session_state.df
         if df is None:
             return {"type": "error", "content": "No data loaded. Please upload an Excel file first."}
         
+        # Repeated questions against the same upload are answered from session state;
+        # the key ignores case and spacing, the original wording is what gets answered
+        answers = st.session_state.answers
+        key = (st.session_state.file_hash, " ".join(query.lower().split()))
+        if key not in answers:
+            if len(answers) >= self.ANSWER_CACHE_SIZE:
+                answers.pop(next(iter(answers)))
+            answers[key] = self._answer(query)
+        return answers[key]
+    
+    def _answer(self, query):
+        """Run the dispatch cascade for a query."""
+        hits = self._match_keywords(query)
+        
         # First try basic queries
-        basic_response = self._process_basic_queries(query)
+        basic_response = self._process_basic_queries(query, hits)
         if basic_response["type"] != "text" or basic_response["content"] == "":
             return basic_response
         
         # Then try visualization requests
-        if any(word in query.lower() for word in ["plot", "chart", "graph", "visualize"]):
+        if hits & self.VISUALIZATION_KEYWORDS:
             return self._process_visualization(query)
         
         # Fall back to statistical analysis
-        return self._process_statistical_query(query)
+        return self._process_statistical_query(query, hits)
+    
+    def _match_keywords(self, query):
+        """Return the set of dispatcher keywords found in the query, in a single scan."""
+        return {m.group(1) for m in self._KEYWORD_RE.finditer(query.lower())}
     
-    def _process_basic_queries(self, query):
+    def _process_basic_queries(self, query, hits):
         """Handle common queries without LLM when possible."""
-        query_lower = query.lower()
-        df = st.session_state.df.copy()
+        df = st.session_state.df
         response = {"type": "text", "content": ""}
         
         try:
             # Product-specific queries
-            if "product" in query_lower and st.session_state.available_products:
-                product = self.utils.extract_product_name(query, st.session_state.available_products)
-                filtered = df[df['Product'].str.lower() == product.lower()]
-                
-                if "date" in query_lower and "quantity" in query_lower:
-                    return {
-                        "type": "dataframe",
-                        "content": filtered[['Date', 'Quantity']],
-                        "explanation": f"Date and quantity for {product}:"
-                    }
-                else:
-                    return {
-                        "type": "dataframe",
-                        "content": filtered,
-                        "explanation": f"All records for {product}:"
-                    }
+            if "product" in hits and st.session_state.available_products:
+                product = self.utils.extract_product_name(
+                    query, st.session_state.available_products, st.session_state.available_products_lower
+                )
+                if product is not None:
+                    filtered = df[df['Product'] == product]
+                    
+                    if "date" in hits and "quantity" in hits:
+                        return {
+                            "type": "dataframe",
+                            "content": filtered[['Date', 'Quantity']],
+                            "explanation": f"Date and quantity for {product}:"
+                        }
+                    else:
+                        return {
+                            "type": "dataframe",
+                            "content": filtered,
+                            "explanation": f"All records for {product}:"
+                        }
             
             # Revenue calculations
-            if "revenue" in query_lower and 'Price' in df.columns and 'Quantity' in df.columns:
-                df['Revenue'] = df['Price'] * df['Quantity']
+            if "revenue" in hits and 'Price' in df.columns and 'Quantity' in df.columns:
+                revenue = self._revenue(df)
                 
-                if "total" in query_lower:
-                    total = df['Revenue'].sum()
+                if "total" in hits:
+                    total = np.nansum(revenue)
                     return {
                         "type": "text",
                         "content": f"Total revenue: ${total:,.2f}"
                     }
                     
-                if "by product" in query_lower:
-                    by_product = df.groupby('Product')['Revenue'].sum().reset_index()
+                if "by product" in hits:
+                    by_product = _revenue_by_product(st.session_state.file_hash, st.session_state.table, revenue)
                     return {
                         "type": "combined",
                         "text": "Total revenue by product:",
@@ -116,17 +340,19 @@ class ExcelChatbot:
                     }
             
             # Quantity analysis
-            if "quantity" in query_lower:
-                if "highest" in query_lower:
-                    max_product = df.loc[df['Quantity'].idxmax()]['Product']
-                    max_qty = df['Quantity'].max()
+            if "quantity" in hits:
+                if "highest" in hits:
+                    quantity = df['Quantity'].to_numpy(dtype='float64', na_value=np.nan)
+                    i = np.nanargmax(quantity)
+                    max_product = df['Product'].iat[i]
+                    max_qty = df['Quantity'].iat[i]
                     return {
                         "type": "text",
                         "content": f"The product with highest quantity is {max_product} ({max_qty} units)"
                     }
                     
-                if "by region" in query_lower and 'Region' in df.columns:
-                    by_region = df.groupby('Region')['Quantity'].sum().reset_index()
+                if "by region" in hits and 'Region' in df.columns:
+                    by_region = _quantity_by_region(st.session_state.file_hash, st.session_state.table)
                     return {
                         "type": "combined",
                         "text": "Total quantity by region:",
@@ -136,15 +362,13 @@ class ExcelChatbot:
                     }
             
             # Time-based analysis
-            if any(word in query_lower for word in ["date", "day", "daily"]) and 'Date' in df.columns:
-                df['Date'] = pd.to_datetime(df['Date'])
-                daily = df.groupby(df['Date'].dt.date)['Quantity'].sum().reset_index()
+            if hits & self.TIME_KEYWORDS and 'Date' in df.columns:
+                daily = _daily_quantity(st.session_state.file_hash, df)
                 return {
                     "type": "combined",
                     "text": "Daily sales quantities:",
                     "dataframe": daily,
-                    "chart": px.line(daily, x='Date', y='Quantity', 
-                                   title='Daily Sales Quantities')
+                    "chart": self._daily_line_chart(daily)
                 }
                 
         except Exception as e:
@@ -152,6 +376,34 @@ class ExcelChatbot:
         
         return response
     
+    def _revenue(self, df):
+        """Price * Quantity for the loaded frame, computed once per upload."""
+        if st.session_state.revenue is None:
+            price = df['Price'].to_numpy(dtype='float64', na_value=np.nan)
+            quantity = df['Quantity'].to_numpy(dtype='float64', na_value=np.nan)
+            st.session_state.revenue = price * quantity
+        return st.session_state.revenue
+    
+    def _daily_line_chart(self, daily):
+        """WebGL line chart; plain ndarrays let Plotly ship the data as typed arrays."""
+        fig = go.Figure(go.Scattergl(
+            x=daily['Date'].to_numpy(),
+            y=daily['Quantity'].to_numpy(dtype=np.float32),
+            mode='lines'
+        ))
+        fig.update_layout(title='Daily Sales Quantities', xaxis_title='Date', yaxis_title='Quantity')
+        return fig
+    
+    def _find_column(self, query):
+        """Resolve a column mentioned in the query via the lowercase name map."""
+        col_lower = st.session_state.col_lower
+        query_lower = query.lower()
+        col = next((col_lower[t] for t in re.findall(r'\w+', query_lower) if t in col_lower), None)
+        if col is None:
+            # Multi-word headers can't match a single token
+            col = next((c for name, c in col_lower.items() if name in query_lower), None)
+        return col
+    
     def _process_visualization(self, query):
         """Handle visualization requests."""
         df = st.session_state.df
@@ -174,13 +426,13 @@ class ExcelChatbot:
                 "content": f"Failed to generate chart: {str(e)}"
             }
     
-    def _process_statistical_query(self, query):
+    def _process_statistical_query(self, query, hits):
         """Handle statistical queries."""
         df = st.session_state.df
         try:
             # Simple column statistics
-            if "average" in query.lower() or "mean" in query.lower():
-                col = next((c for c in df.columns if c.lower() in query.lower()), None)
+            if "average" in hits or "mean" in hits:
+                col = self._find_column(query)
                 if col and pd.api.types.is_numeric_dtype(df[col]):
                     avg = df[col].mean()
                     return {
@@ -189,25 +441,26 @@ class ExcelChatbot:
                     }
             
             # Count queries
-            if "how many" in query.lower():
-                if "product" in query.lower():
+            if "how many" in hits:
+                if "product" in hits:
                     count = len(df['Product'].unique())
                     return {
                         "type": "text",
                         "content": f"There are {count} different products"
                     }
-                if "region" in query.lower() and 'Region' in df.columns:
+                if "region" in hits and 'Region' in df.columns:
                     count = len(df['Region'].unique())
                     return {
                         "type": "text",
                         "content": f"There are {count} different regions"
                     }
             
-            # Default statistical summary
-            desc = df.describe(include='all').round(2)
+            # Default statistical summary, computed once per upload
+            if st.session_state.describe is None:
+                st.session_state.describe = df.describe(include='all').round(2)
             return {
                 "type": "dataframe",
-                "content": desc,
+                "content": st.session_state.describe,
                 "explanation": "Here's a statistical summary of your data:"
             }
             
@@ -217,6 +470,11 @@ class ExcelChatbot:
                 "content": f"Couldn't analyze your query: {str(e)}"
             }
 
+def next_chart_id():
+    """Stable per-session id so Streamlit can key chart elements across reruns."""
+    st.session_state.chart_counter += 1
+    return st.session_state.chart_counter
+
 def main():
     st.title("📊 Excel Insights Chatbot")
     st.markdown("Upload an Excel file and ask questions in natural language to get insights, statistics, and visualizations.")
@@ -235,7 +493,10 @@ def main():
         )
         
         if uploaded_file is not None:
-            if st.session_state.uploaded_file_name != uploaded_file.name:
+            if uploaded_file.size > Config.MAX_FILE_SIZE_MB * 1024 * 1024:
+                # Reject before parsing so oversized workbooks never reach the reader
+                st.error(f"❌ File is larger than {Config.MAX_FILE_SIZE_MB} MB. Please upload a smaller file.")
+            elif st.session_state.uploaded_file_name != uploaded_file.name:
                 # New file uploaded
                 st.session_state.uploaded_file_name = uploaded_file.name
                 
@@ -248,12 +509,13 @@ def main():
                             st.info(f"📈 Dataset: {st.session_state.df.shape[0]} rows, {st.session_state.df.shape[1]} columns")
                         
                         # Clear previous messages when new file is loaded
-                        st.session_state.messages = []
+                        st.session_state.messages = deque(maxlen=Config.MAX_CHAT_MESSAGES)
                         
                         # Show dataset preview
                         if st.session_state.df is not None:
                             st.subheader("Data Preview")
-                            st.dataframe(st.session_state.df.head(), use_container_width=True)
+                            # Arrow slices go straight to the frontend without a pandas round trip
+                            st.dataframe(st.session_state.table.slice(0, 5), use_container_width=True)
                             
                             # Show column information
                             st.subheader("Column Information")
@@ -299,7 +561,9 @@ def main():
                 elif message["type"] == "dataframe":
                     st.dataframe(message["content"], use_container_width=True)
                 elif message["type"] == "chart":
-                    st.plotly_chart(message["content"], use_container_width=True)
+                    # Keep the live Figure: st.plotly_chart re-validates dict/JSON input,
+                    # which costs several times more than serialising a Figure
+                    st.plotly_chart(message["content"], use_container_width=True, key=f"chart_{message['id']}")
         
         # Chat input
         if prompt := st.chat_input("Ask a question about your data..."):
@@ -334,8 +598,9 @@ def main():
                             st.markdown(response["explanation"])
                             st.session_state.messages.append({"role": "assistant", "type": "text", "content": response["explanation"]})
                         
-                        st.plotly_chart(response["content"], use_container_width=True)
-                        st.session_state.messages.append({"role": "assistant", "type": "chart", "content": response["content"]})
+                        chart_id = next_chart_id()
+                        st.plotly_chart(response["content"], use_container_width=True, key=f"chart_{chart_id}")
+                        st.session_state.messages.append({"role": "assistant", "type": "chart", "content": response["content"], "id": chart_id})
                     
                     elif response["type"] == "combined":
                         if "text" in response:
@@ -347,8 +612,9 @@ def main():
                             st.session_state.messages.append({"role": "assistant", "type": "dataframe", "content": response["dataframe"]})
                         
                         if "chart" in response:
-                            st.plotly_chart(response["chart"], use_container_width=True)
-                            st.session_state.messages.append({"role": "assistant", "type": "chart", "content": response["chart"]})
+                            chart_id = next_chart_id()
+                            st.plotly_chart(response["chart"], use_container_width=True, key=f"chart_{chart_id}")
+                            st.session_state.messages.append({"role": "assistant", "type": "chart", "content": response["chart"], "id": chart_id})
 
 if __name__ == "__main__":
     main()
@@ -11,6 +11,8 @@ class Config:
     MAX_FILE_SIZE_MB = 5
     ALLOWED_FILE_TYPES = ['.xlsx', '.xls']
     DEFAULT_CHART_THEME = 'plotly_white'
+    MAX_CHAT_MESSAGES = 50
+    CACHE_DIR = os.getenv('EXCEL_CHATBOT_CACHE_DIR', os.path.expanduser('~/.cache/excel_chatbot'))
     
     # OpenAI settings
     OPENAI_SETTINGS = {
@@ -1,9 +1,32 @@
 import pandas as pd
 import numpy as np
-import re
 from typing import Tuple, Dict, Any, List
 import io
 
+class _ColumnNameTable(dict):
+    """str.translate table: [a-z0-9_] map to themselves, everything else to '_'."""
+    
+    def __missing__(self, codepoint):
+        return '_'
+
+_COLUMN_NAME_TABLE = _ColumnNameTable(
+    (ord(c), c) for c in 'abcdefghijklmnopqrstuvwxyz0123456789_'
+)
+
+_BINARY_PATTERNS = (
+    frozenset({'yes', 'no'}),
+    frozenset({'true', 'false'}),
+    frozenset({'1', '0'}),
+    frozenset({'y', 'n'}),
+    frozenset({'1.0', '0.0'}),
+    frozenset({'male', 'female'}),
+    frozenset({'m', 'f'}),
+)
+_BINARY_NUMERIC = (0, 1)
+
+# Fixed formats tried before falling back to per-element dateutil parsing
+_DATETIME_FORMATS = ('ISO8601', '%m/%d/%Y', '%d/%m/%Y')
+
 class DataProcessor:
     """
     Handles Excel file loading, data preprocessing, and column normalization.
@@ -18,6 +41,11 @@ class DataProcessor:
         self.categorical_columns = []
         self.binary_columns = []
         self.datetime_columns = []
+        self._column_names = []  # (lowercased name, normalized column) pairs
+        self._keyword_columns = {}  # Keyword -> matching columns, filled lazily
+        self._correlation_df = None  # Frame and columns the cached correlation matrix was computed for
+        self._correlation_columns = None
+        self._correlation_matrix = None
     
     def load_excel(self, uploaded_file) -> Tuple[bool, str]:
         """
@@ -30,15 +58,19 @@ class DataProcessor:
             Tuple of (success: bool, message: str)
         """
         try:
-            # Read Excel file
-            df = pd.read_excel(uploaded_file, sheet_name=0)  # Read first sheet only
+            # Read first sheet only; one row past the cap is enough to reject oversized files
+            try:
+                df = pd.read_excel(uploaded_file, sheet_name=0, engine="calamine", nrows=501)
+            except ImportError:
+                # python-calamine unavailable; pandas opens openpyxl workbooks read-only
+                df = pd.read_excel(uploaded_file, sheet_name=0, engine="openpyxl", nrows=501)
             
             # Basic validation
             if df.empty:
                 return False, "The Excel file is empty."
             
             if df.shape[0] > 500:
-                return False, f"File has {df.shape[0]} rows. Maximum allowed is 500 rows."
+                return False, "File has more than 500 rows. Maximum allowed is 500 rows."
             
             if df.shape[1] > 20:
                 return False, f"File has {df.shape[1]} columns. Maximum allowed is 20 columns."
@@ -46,22 +78,21 @@ class DataProcessor:
             if df.shape[1] < 1:
                 return False, "File must have at least 1 column."
             
-            # Store original column names and normalize them
+            # Store original column names and normalize them, rejecting duplicates as they appear
             self.original_columns = {}
             normalized_columns = []
             
             for col in df.columns:
                 normalized_col = self._normalize_column_name(str(col))
+                if normalized_col in self.original_columns:
+                    return False, "Column names result in duplicates after normalization. Please ensure column names are distinct."
                 self.original_columns[normalized_col] = col
                 normalized_columns.append(normalized_col)
             
-            # Check for duplicate normalized column names
-            if len(set(normalized_columns)) != len(normalized_columns):
-                return False, "Column names result in duplicates after normalization. Please ensure column names are distinct."
-            
             # Update dataframe with normalized column names
             df.columns = normalized_columns
             self.df = df
+            self._build_column_name_index()
             
             # Infer column types
             self._infer_column_types()
@@ -83,10 +114,11 @@ class DataProcessor:
         col_name = col_name.lower()
         
         # Replace spaces and special characters with underscores
-        col_name = re.sub(r'[^a-z0-9_]', '_', col_name)
+        col_name = col_name.translate(_COLUMN_NAME_TABLE)
         
         # Remove multiple consecutive underscores
-        col_name = re.sub(r'_+', '_', col_name)
+        while '__' in col_name:
+            col_name = col_name.replace('__', '_')
         
         # Remove leading/trailing underscores
         col_name = col_name.strip('_')
@@ -131,22 +163,45 @@ class DataProcessor:
                 else:
                     self.categorical_columns.append(col)
                     self.column_types[col] = 'categorical'
+            
+            # Low-cardinality text columns become categoricals so nunique/mode/== run on integer codes
+            for col in self.categorical_columns + self.binary_columns:
+                series = self.df[col]
+                if pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+                    if series.nunique() <= min(len(series) // 2, 100):
+                        self.df[col] = series.astype('category')
     
     def _is_datetime_column(self, col: str) -> bool:
         """Check if a column contains datetime values."""
         try:
             if self.df is None:
                 return False
-            # Try to convert a sample of non-null values to datetime
-            sample = self.df[col].dropna().head(10)
-            if len(sample) == 0:
+            series = self.df[col]
+            if pd.api.types.is_datetime64_any_dtype(series.dtype):
+                return True
+            
+            # One pass over the values tells datetime objects from strings and numbers
+            inferred = pd.api.types.infer_dtype(series, skipna=True)
+            if inferred in ('datetime', 'datetime64', 'date'):
+                self.df[col] = pd.to_datetime(series, errors='coerce')
+                return True
+            if inferred != 'string':
                 return False
             
-            # Try to parse as datetime
+            # Try to parse a sample of the strings as datetime
+            sample = series.dropna().head(10)
+            for fmt in _DATETIME_FORMATS:
+                try:
+                    pd.to_datetime(sample, format=fmt, errors='raise')
+                except (ValueError, TypeError):
+                    continue
+                self.df[col] = pd.to_datetime(series, format=fmt, errors='coerce')
+                return True
+            
             pd.to_datetime(sample, errors='raise')
             
             # If successful, convert the entire column
-            self.df[col] = pd.to_datetime(self.df[col], errors='coerce')
+            self.df[col] = pd.to_datetime(series, errors='coerce')
             return True
         except:
             return False
@@ -156,32 +211,24 @@ class DataProcessor:
         try:
             if self.df is None:
                 return False
-            unique_values = self.df[col].dropna().unique()
+            values = self.df[col].dropna()
+            unique_values = values.unique()
             
             # Remove case sensitivity and strip whitespace
-            unique_str = [str(val).strip().lower() for val in unique_values]
-            unique_set = set(unique_str)
+            unique_index = pd.Index(unique_values)
+            if not pd.api.types.is_string_dtype(unique_index):
+                unique_index = unique_index.astype(str)
+            unique_set = set(unique_index.str.strip().str.lower())
             
             # Check for various binary patterns
-            binary_patterns = [
-                {'yes', 'no'},
-                {'true', 'false'},
-                {'1', '0'},
-                {'y', 'n'},
-                {'1.0', '0.0'},
-                {'male', 'female'},
-                {'m', 'f'}
-            ]
-            
-            for pattern in binary_patterns:
-                if unique_set.issubset(pattern) and len(unique_set) <= 2:
-                    return True
+            if len(unique_set) <= 2:
+                for pattern in _BINARY_PATTERNS:
+                    if unique_set <= pattern:
+                        return True
             
             # Check if it's numeric with only 0s and 1s
-            if self.df is not None and pd.api.types.is_numeric_dtype(self.df[col]):
-                unique_numeric = set(unique_values)
-                if unique_numeric.issubset({0, 1, 0.0, 1.0}) and len(unique_numeric) <= 2:
-                    return True
+            if pd.api.types.is_numeric_dtype(values) and values.isin(_BINARY_NUMERIC).all():
+                return True
             
             return False
         except:
@@ -196,28 +243,36 @@ class DataProcessor:
         
         info_data = []
         
-        for col in self.df.columns:
+        # Frame-wide reductions, one pass each instead of one call per column
+        nulls = self.df.isna().sum()
+        non_null = len(self.df) - nulls
+        unique = self.df.nunique()
+        numeric = self.df[self.numeric_columns]
+        mins, maxs, means = numeric.min(), numeric.max(), numeric.mean()
+        
+        for col, series in self.df.items():
             col_info = {
                 'Column': self.original_columns.get(col, col),
                 'Normalized_Name': col,
                 'Type': self.column_types.get(col, 'unknown'),
-                'Non_Null_Count': self.df[col].count(),
-                'Null_Count': self.df[col].isnull().sum(),
-                'Unique_Values': self.df[col].nunique()
+                'Non_Null_Count': non_null[col],
+                'Null_Count': nulls[col],
+                'Unique_Values': unique[col]
             }
             
             # Add type-specific statistics
             if col in self.numeric_columns:
-                col_info['Min'] = self.df[col].min()
-                col_info['Max'] = self.df[col].max()
-                try:
-                    mean_val = float(self.df[col].mean())
-                    col_info['Mean'] = round(mean_val, 2) if not pd.isna(mean_val) else None
-                except:
-                    col_info['Mean'] = None
+                col_info['Min'] = mins[col]
+                col_info['Max'] = maxs[col]
+                mean_val = float(means[col])
+                col_info['Mean'] = round(mean_val, 2) if not pd.isna(mean_val) else None
             elif col in self.categorical_columns or col in self.binary_columns:
-                top_value = self.df[col].mode()
-                col_info['Most_Common'] = top_value.iloc[0] if len(top_value) > 0 else None
+                # Nothing repeats when every row is distinct, so skip the count
+                if unique[col] == len(self.df):
+                    col_info['Most_Common'] = None
+                else:
+                    counts = series.value_counts()
+                    col_info['Most_Common'] = counts.index[0] if len(counts) > 0 else None
             
             info_data.append(col_info)
         
@@ -230,19 +285,58 @@ class DataProcessor:
         if self.df is None:
             return []
         
-        suggestions = []
-        query_lower = [kw.lower() for kw in query_keywords]
+        suggestions = set()
+        for keyword in query_keywords:
+            suggestions.update(self._columns_matching_keyword(keyword.lower()))
         
+        return list(suggestions)
+    
+    def _build_column_name_index(self):
+        """
+        Lowercase the normalized and original column names once per load.
+        A keyword inside any word of a name is also inside the full name,
+        so the full names are all that needs scanning.
+        """
+        self._keyword_columns = {}
+        self._column_names = []
         for norm_col, orig_col in self.original_columns.items():
-            # Check if any keyword matches column name
-            for keyword in query_lower:
-                if (keyword in norm_col.lower() or 
-                    keyword in orig_col.lower() or
-                    any(keyword in word for word in norm_col.lower().split('_'))):
-                    suggestions.append(norm_col)
-                    break
+            self._column_names.append((norm_col, norm_col))
+            self._column_names.append((str(orig_col).lower(), norm_col))
+    
+    def _columns_matching_keyword(self, keyword: str) -> set:
+        """Columns whose name contains the keyword, memoized per keyword."""
+        columns = self._keyword_columns.get(keyword)
+        if columns is None:
+            columns = {col for name, col in self._column_names if keyword in name}
+            self._keyword_columns[keyword] = columns
+        return columns
+    
+    def get_correlation_matrix(self) -> pd.DataFrame:
+        """
+        Get the correlation matrix of the numeric columns, cached until the data changes.
+        """
+        if self.df is None:
+            return pd.DataFrame()
+        
+        numeric_cols = list(self.numeric_columns)
+        if self._correlation_df is self.df and self._correlation_columns == numeric_cols:
+            return self._correlation_matrix
+        
+        values = self.df[numeric_cols].to_numpy(dtype=np.float64, na_value=np.nan)
+        if np.isnan(values).any():
+            # Missing values need pandas' pairwise-complete correlations
+            correlation_matrix = self.df[numeric_cols].corr()
+        else:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                correlation_matrix = pd.DataFrame(
+                    np.corrcoef(values, rowvar=False).reshape(len(numeric_cols), len(numeric_cols)),
+                    index=numeric_cols, columns=numeric_cols
+                )
         
-        return list(set(suggestions))
+        self._correlation_df = self.df
+        self._correlation_columns = numeric_cols
+        self._correlation_matrix = correlation_matrix
+        return correlation_matrix
     
     def get_summary_statistics(self) -> Dict[str, Any]:
         """
@@ -271,13 +365,15 @@ class DataProcessor:
             return []
         
         matching_columns = []
-        search_lower = search_term.lower()
         
         for col in self.df.columns:
             # Check if the search term appears in column values
             try:
-                col_str = self.df[col].astype(str).str.lower()
-                if col_str.str.contains(search_lower, na=False).any():
+                col_str = self.df[col]
+                if not pd.api.types.is_string_dtype(col_str):
+                    col_str = col_str.astype(str)
+                # Literal, case-insensitive substring match; no regex compile or lowered copy
+                if col_str.str.contains(search_term, case=False, regex=False, na=False).any():
                     matching_columns.append(col)
             except:
                 continue
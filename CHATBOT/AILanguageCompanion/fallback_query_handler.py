@@ -1,8 +1,36 @@
-import pandas as pd
 import numpy as np
 import re
+from collections import OrderedDict
 from typing import Dict, Any, List, Optional
 from visualization import ChartGenerator
+from utils import DataUtils
+
+def _compile_text_index(lookup: Dict[str, list]) -> tuple:
+    """Pair a text -> entries lookup with one lookahead alternation over its texts."""
+    texts = sorted((t for t in lookup if t), key=len, reverse=True)
+    pattern = re.compile(
+        "(?=(" + "|".join(re.escape(t) for t in texts) + "))"
+    ) if texts else None
+    return pattern, lookup
+
+def _scan_text_index(index: tuple, query: str):
+    """Yield the entries of every indexed text that occurs in the query."""
+    pattern, lookup = index
+    matches = [m.group(1) for m in pattern.finditer(query)] if pattern else []
+    yield from lookup.get('', ())
+    for text in matches:
+        # The scan reports the longest text at each position; shorter
+        # texts starting there are prefixes of it
+        for end in range(1, len(text) + 1):
+            yield from lookup.get(text[:end], ())
+
+def _keyword_index(tagged_keywords) -> tuple:
+    """Text index mapping each keyword to the tags it belongs to."""
+    lookup = {}
+    for tag, keywords in tagged_keywords:
+        for keyword in keywords:
+            lookup.setdefault(keyword, []).append(tag)
+    return _compile_text_index(lookup)
 
 class FallbackQueryHandler:
     """
@@ -10,9 +38,54 @@ class FallbackQueryHandler:
     Provides basic data analysis capabilities without external API dependencies.
     """
     
+    INTENT_KEYWORDS = {
+        'summary': (
+            'average', 'mean', 'sum', 'total', 'count', 'minimum', 'maximum', 
+            'min', 'max', 'median', 'std', 'standard deviation', 'statistics',
+            'how many', 'what is the'
+        ),
+        'visualization': (
+            'chart', 'graph', 'plot', 'histogram', 'bar chart', 'line chart',
+            'scatter plot', 'pie chart', 'box plot', 'show', 'visualize',
+            'display', 'create a'
+        ),
+        'filter': (
+            'where', 'filter', 'under', 'over', 'above', 'below', 'greater than',
+            'less than', 'equal to', 'customers who', 'records where'
+        ),
+        'comparison': (
+            'compare', 'comparison', 'by', 'across', 'between', 'vs', 'versus'
+        ),
+        'correlation': (
+            'correlation', 'relationship', 'related', 'correlated'
+        )
+    }
+    # In priority order; bar is the default
+    CHART_TYPE_KEYWORDS = {
+        'histogram': ('histogram', 'distribution'),
+        'line': ('line', 'trend'),
+        'scatter': ('scatter',),
+        'pie': ('pie',),
+        'box': ('box',)
+    }
+    # Intents and chart types are both read off one scan of the query
+    _KEYWORD_INDEX = _keyword_index(
+        [(('intent', intent), kws) for intent, kws in INTENT_KEYWORDS.items()]
+        + [(('chart', chart_type), kws) for chart_type, kws in CHART_TYPE_KEYWORDS.items()]
+    )
+    
+    CHART_CACHE_SIZE = 16
+    
+    _AGE_FILTER_RE = re.compile(r'(?:under|below) (\d+)|(?:over|above) (\d+)')
+    
     def __init__(self, data_processor):
         self.data_processor = data_processor
         self.chart_generator = ChartGenerator()
+        self._index_df = None  # Frame the query indexes below were built for
+        self._column_index = (None, {})
+        self._value_index = (None, {})
+        self._chart_cache = OrderedDict()  # Recent charts for the current dataframe
+        self._chart_cache_df = None
     
     def process_query(self, query: str) -> Dict[str, Any]:
         """
@@ -26,17 +99,18 @@ class FallbackQueryHandler:
         """
         try:
             query_lower = query.lower().strip()
+            intents, chart_type = self._match_keywords(query_lower)
             
             # Analyze query intent using rule-based patterns
-            if self._is_summary_query(query_lower):
+            if 'summary' in intents:
                 return self._handle_summary_query(query_lower)
-            elif self._is_visualization_query(query_lower):
-                return self._handle_visualization_query(query_lower)
-            elif self._is_filter_query(query_lower):
+            elif 'visualization' in intents:
+                return self._handle_visualization_query(query_lower, chart_type)
+            elif 'filter' in intents:
                 return self._handle_filter_query(query_lower)
-            elif self._is_comparison_query(query_lower):
+            elif 'comparison' in intents:
                 return self._handle_comparison_query(query_lower)
-            elif self._is_correlation_query(query_lower):
+            elif 'correlation' in intents:
                 return self._handle_correlation_query(query_lower)
             else:
                 return self._handle_general_query(query_lower)
@@ -47,65 +121,26 @@ class FallbackQueryHandler:
                 "content": f"An error occurred while processing your query: {str(e)}"
             }
     
-    def _is_summary_query(self, query: str) -> bool:
-        """Check if query is asking for summary statistics."""
-        summary_keywords = [
-            'average', 'mean', 'sum', 'total', 'count', 'minimum', 'maximum', 
-            'min', 'max', 'median', 'std', 'standard deviation', 'statistics',
-            'how many', 'what is the'
-        ]
-        return any(keyword in query for keyword in summary_keywords)
-    
-    def _is_visualization_query(self, query: str) -> bool:
-        """Check if query is asking for visualization."""
-        viz_keywords = [
-            'chart', 'graph', 'plot', 'histogram', 'bar chart', 'line chart',
-            'scatter plot', 'pie chart', 'box plot', 'show', 'visualize',
-            'display', 'create a'
-        ]
-        return any(keyword in query for keyword in viz_keywords)
-    
-    def _is_filter_query(self, query: str) -> bool:
-        """Check if query involves filtering."""
-        filter_keywords = [
-            'where', 'filter', 'under', 'over', 'above', 'below', 'greater than',
-            'less than', 'equal to', 'customers who', 'records where'
-        ]
-        return any(keyword in query for keyword in filter_keywords)
-    
-    def _is_comparison_query(self, query: str) -> bool:
-        """Check if query involves comparison."""
-        comparison_keywords = [
-            'compare', 'comparison', 'by', 'across', 'between', 'vs', 'versus'
-        ]
-        return any(keyword in query for keyword in comparison_keywords)
-    
-    def _is_correlation_query(self, query: str) -> bool:
-        """Check if query asks for correlation."""
-        correlation_keywords = [
-            'correlation', 'relationship', 'related', 'correlated'
-        ]
-        return any(keyword in query for keyword in correlation_keywords)
+    def _match_keywords(self, query: str) -> tuple:
+        """Return the matched intents and the requested chart type from a single scan of the query."""
+        tags = set(_scan_text_index(self._KEYWORD_INDEX, query))
+        intents = {name for kind, name in tags if kind == 'intent'}
+        chart_type = next((t for t in self.CHART_TYPE_KEYWORDS if ('chart', t) in tags), 'bar')
+        return intents, chart_type
     
     def _find_columns_in_query(self, query: str) -> List[str]:
         """Find column names mentioned in the query."""
-        found_columns = []
+        self._build_query_indexes()
         
-        # Check normalized column names
-        for col in self.data_processor.df.columns:
-            if col.replace('_', ' ') in query or col in query:
-                found_columns.append(col)
-        
-        # Check original column names
-        for norm_col, orig_col in self.data_processor.original_columns.items():
-            if orig_col.lower() in query:
-                found_columns.append(norm_col)
+        # Normalized names, their spaced form and original names in one scan,
+        # deduplicated in order of first mention
+        found_columns = dict.fromkeys(_scan_text_index(self._column_index, query))
         
         # Look for common data terms and map to likely columns
         if not found_columns:
-            found_columns = self._infer_columns_from_terms(query)
+            found_columns = dict.fromkeys(self._infer_columns_from_terms(query))
         
-        return list(set(found_columns))
+        return list(found_columns)
     
     def _infer_columns_from_terms(self, query: str) -> List[str]:
         """Infer columns based on common terms in query."""
@@ -155,52 +190,62 @@ class FallbackQueryHandler:
                 return {
                     "type": "combined",
                     "text": explanation,
-                    "dataframe": pd.DataFrame([stats])
+                    "dataframe": DataUtils.records_to_frame([stats])
                 }
             
+            df = self.data_processor.df
+            columns = [col for col in columns[:5] if col in df.columns]  # Limit to 5 columns
+            
+            # Frame-wide reductions over the mentioned numeric columns; they skip NaN themselves
+            numeric_data = df[[col for col in columns if col in self.data_processor.numeric_columns]]
+            counts = numeric_data.count()
+            if 'average' in query or 'mean' in query:
+                label, values = "Average", numeric_data.mean().round(2)
+            elif 'sum' in query or 'total' in query:
+                label, values = "Total", numeric_data.sum().round(2)
+            elif 'count' in query:
+                label, values = "Count of", counts
+            elif 'min' in query:
+                label, values = "Minimum", numeric_data.min()
+            elif 'max' in query:
+                label, values = "Maximum", numeric_data.max()
+            else:
+                # Default comprehensive stats
+                label = None
+                means, mins, maxs = numeric_data.mean().round(2), numeric_data.min(), numeric_data.max()
+            
             results = []
-            for col in columns[:5]:  # Limit to 5 columns
-                if col in self.data_processor.df.columns:
-                    orig_name = self.data_processor.original_columns.get(col, col)
-                    col_data = self.data_processor.df[col].dropna()
-                    
-                    if col in self.data_processor.numeric_columns:
-                        if 'average' in query or 'mean' in query:
-                            value = round(col_data.mean(), 2) if len(col_data) > 0 else 0
-                            results.append({"Statistic": f"Average {orig_name}", "Value": value})
-                        elif 'sum' in query or 'total' in query:
-                            value = round(col_data.sum(), 2) if len(col_data) > 0 else 0
-                            results.append({"Statistic": f"Total {orig_name}", "Value": value})
-                        elif 'count' in query:
-                            results.append({"Statistic": f"Count of {orig_name}", "Value": len(col_data)})
-                        elif 'min' in query:
-                            value = col_data.min() if len(col_data) > 0 else 0
-                            results.append({"Statistic": f"Minimum {orig_name}", "Value": value})
-                        elif 'max' in query:
-                            value = col_data.max() if len(col_data) > 0 else 0
-                            results.append({"Statistic": f"Maximum {orig_name}", "Value": value})
-                        else:
-                            # Default comprehensive stats
-                            stats = {
-                                "Column": orig_name,
-                                "Count": len(col_data),
-                                "Mean": round(col_data.mean(), 2) if len(col_data) > 0 else None,
-                                "Min": col_data.min() if len(col_data) > 0 else None,
-                                "Max": col_data.max() if len(col_data) > 0 else None
-                            }
-                            results.append(stats)
-                    
-                    elif col in self.data_processor.categorical_columns + self.data_processor.binary_columns:
-                        if 'count' in query:
-                            unique_count = col_data.nunique()
-                            results.append({"Statistic": f"Unique values in {orig_name}", "Value": unique_count})
-                        else:
-                            value_counts = col_data.value_counts()
-                            most_common = value_counts.index[0] if len(value_counts) > 0 else "None"
-                            results.append({"Statistic": f"Most common {orig_name}", "Value": most_common})
+            for col in columns:
+                orig_name = self.data_processor.original_columns.get(col, col)
+                
+                if col in self.data_processor.numeric_columns:
+                    has_data = counts[col] > 0
+                    if label is None:
+                        stats = {
+                            "Column": orig_name,
+                            "Count": counts[col],
+                            "Mean": means[col] if has_data else None,
+                            "Min": mins[col] if has_data else None,
+                            "Max": maxs[col] if has_data else None
+                        }
+                        results.append(stats)
+                    else:
+                        value = values[col] if has_data else 0
+                        results.append({"Statistic": f"{label} {orig_name}", "Value": value})
+                
+                elif col in self.data_processor.categorical_columns + self.data_processor.binary_columns:
+                    col_data = df[col]
+                    if 'count' in query:
+                        unique_count = col_data.nunique()
+                        results.append({"Statistic": f"Unique values in {orig_name}", "Value": unique_count})
+                    else:
+                        # mode only sorts the tied top values, not the whole histogram
+                        modes = col_data.mode()
+                        most_common = modes.iat[0] if len(modes) > 0 else "None"
+                        results.append({"Statistic": f"Most common {orig_name}", "Value": most_common})
             
             if results:
-                results_df = pd.DataFrame(results)
+                results_df = DataUtils.records_to_frame(results)
                 explanation = f"Here are the statistics for the columns I found in your query:"
                 return {
                     "type": "combined",
@@ -219,7 +264,7 @@ class FallbackQueryHandler:
                 "content": f"Error processing summary query: {str(e)}"
             }
     
-    def _handle_visualization_query(self, query: str) -> Dict[str, Any]:
+    def _handle_visualization_query(self, query: str, chart_type: str = "bar") -> Dict[str, Any]:
         """Handle visualization requests."""
         try:
             columns = self._find_columns_in_query(query)
@@ -230,25 +275,15 @@ class FallbackQueryHandler:
                     "content": "I couldn't identify which columns to visualize. Please specify the data you want to see."
                 }
             
-            # Determine chart type from query
-            chart_type = "bar"
-            if 'histogram' in query or 'distribution' in query:
-                chart_type = "histogram"
-            elif 'line' in query or 'trend' in query:
-                chart_type = "line"
-            elif 'scatter' in query:
-                chart_type = "scatter"
-            elif 'pie' in query:
-                chart_type = "pie"
-            elif 'box' in query:
-                chart_type = "box"
-            
-            chart = self.chart_generator.create_chart(
-                df=self.data_processor.df,
-                columns=columns,
-                chart_type=chart_type,
-                original_columns=self.data_processor.original_columns,
-                column_types=self.data_processor.column_types
+            chart = self._cached_chart(
+                ('chart', tuple(columns), chart_type),
+                lambda: self.chart_generator.create_chart(
+                    df=self.data_processor.df,
+                    columns=columns,
+                    chart_type=chart_type,
+                    original_columns=self.data_processor.original_columns,
+                    column_types=self.data_processor.column_types
+                )
             )
             
             if chart:
@@ -271,15 +306,32 @@ class FallbackQueryHandler:
                 "content": f"Error creating visualization: {str(e)}"
             }
     
+    def _cached_chart(self, key: tuple, build):
+        """Return the chart for key, building it only if it isn't cached for the current dataframe."""
+        if self._chart_cache_df is not self.data_processor.df:
+            self._chart_cache.clear()
+            self._chart_cache_df = self.data_processor.df
+        
+        if key in self._chart_cache:
+            self._chart_cache.move_to_end(key)
+            return self._chart_cache[key]
+        
+        chart = build()
+        if chart:
+            self._chart_cache[key] = chart
+            if len(self._chart_cache) > self.CHART_CACHE_SIZE:
+                self._chart_cache.popitem(last=False)
+        return chart
+    
     def _handle_filter_query(self, query: str) -> Dict[str, Any]:
         """Handle filtered queries."""
         try:
-            filtered_df = self.data_processor.df.copy()
+            df = self.data_processor.df
+            mask = np.ones(len(df), dtype=bool)
             condition_applied = False
             
             # Look for age-based filters
-            age_pattern = r'under (\d+)|over (\d+)|above (\d+)|below (\d+)'
-            matches = re.findall(age_pattern, query)
+            matches = self._AGE_FILTER_RE.findall(query)
             
             if matches:
                 age_cols = [col for col in self.data_processor.numeric_columns 
@@ -287,34 +339,27 @@ class FallbackQueryHandler:
                 
                 if age_cols:
                     age_col = age_cols[0]
-                    for match in matches:
-                        if match[0]:  # under X
-                            filtered_df = filtered_df[filtered_df[age_col] < int(match[0])]
-                            condition_applied = True
-                        elif match[1] or match[2]:  # over X or above X
-                            threshold = int(match[1] or match[2])
-                            filtered_df = filtered_df[filtered_df[age_col] > threshold]
-                            condition_applied = True
-                        elif match[3]:  # below X
-                            filtered_df = filtered_df[filtered_df[age_col] < int(match[3])]
-                            condition_applied = True
+                    ages = df[age_col].to_numpy(dtype='float64', na_value=np.nan)
+                    for below, above in matches:
+                        if below:  # under X or below X
+                            mask &= ages < int(below)
+                        else:  # over X or above X
+                            mask &= ages > int(above)
+                        condition_applied = True
             
             # Look for specific value filters
-            for col in self.data_processor.categorical_columns + self.data_processor.binary_columns:
-                col_values = self.data_processor.df[col].dropna().unique()
-                for value in col_values:
-                    if str(value).lower() in query:
-                        filtered_df = filtered_df[filtered_df[col] == value]
-                        condition_applied = True
-                        break
+            for col, value in self.find_values_in_query(query).items():
+                mask &= (df[col] == value).to_numpy(dtype=bool, na_value=False)
+                condition_applied = True
             
             if condition_applied:
-                count = len(filtered_df)
+                matching_rows = np.flatnonzero(mask)
+                count = len(matching_rows)
                 explanation = f"Found {count} records matching your criteria."
                 
                 if count > 0:
-                    display_df = filtered_df.head(20)
-                    display_df.columns = [self.data_processor.original_columns.get(col, col) for col in display_df.columns]
+                    # Only the displayed rows are ever copied out of the frame
+                    display_df = df.iloc[matching_rows[:20]].rename(columns=self.data_processor.original_columns)
                     
                     return {
                         "type": "combined",
@@ -338,6 +383,43 @@ class FallbackQueryHandler:
                 "content": f"Error processing filter: {str(e)}"
             }
     
+    def find_values_in_query(self, query: str) -> Dict[str, Any]:
+        """
+        Map each categorical/binary column to the first of its values (in
+        order of appearance) whose lowercased text occurs in the query.
+        The query is expected to be lowercased already.
+        """
+        self._build_query_indexes()
+        
+        found = {}
+        for col, rank, value in _scan_text_index(self._value_index, query):
+            if col not in found or rank < found[col][0]:
+                found[col] = (rank, value)
+        
+        return {col: found[col][1] for col in self.data_processor.categorical_columns + self.data_processor.binary_columns if col in found}
+    
+    def _build_query_indexes(self):
+        """Index column aliases and categorical values once per loaded dataframe."""
+        df = self.data_processor.df
+        if self._index_df is df:
+            return
+        
+        aliases = {}
+        for col in df.columns:
+            aliases.setdefault(col, []).append(col)
+            aliases.setdefault(col.replace('_', ' '), []).append(col)
+        for norm_col, orig_col in self.data_processor.original_columns.items():
+            aliases.setdefault(str(orig_col).lower(), []).append(norm_col)
+        
+        values = {}
+        for col in self.data_processor.categorical_columns + self.data_processor.binary_columns:
+            for rank, value in enumerate(df[col].dropna().unique()):
+                values.setdefault(str(value).lower(), []).append((col, rank, value))
+        
+        self._column_index = _compile_text_index(aliases)
+        self._value_index = _compile_text_index(values)
+        self._index_df = df
+    
     def _handle_comparison_query(self, query: str) -> Dict[str, Any]:
         """Handle comparison queries."""
         try:
@@ -349,11 +431,15 @@ class FallbackQueryHandler:
                     "content": "I need at least two columns to make a comparison. Please specify what you want to compare."
                 }
             
-            chart = self.chart_generator.create_comparison_chart(
-                df=self.data_processor.df,
-                columns=columns,
-                original_columns=self.data_processor.original_columns,
-                column_types=self.data_processor.column_types
+            chart = self._cached_chart(
+                ('comparison', tuple(columns)),
+                lambda: self.chart_generator.create_chart(
+                    df=self.data_processor.df,
+                    columns=columns,
+                    chart_type='comparison',
+                    original_columns=self.data_processor.original_columns,
+                    column_types=self.data_processor.column_types
+                )
             )
             
             if chart:
@@ -388,7 +474,7 @@ class FallbackQueryHandler:
                 }
             
             # Calculate correlation matrix
-            correlation_matrix = self.data_processor.df[numeric_cols].corr()
+            correlation_matrix = self.data_processor.get_correlation_matrix()
             
             # Create heatmap
             chart = self.chart_generator.create_correlation_heatmap(
@@ -439,7 +525,7 @@ class FallbackQueryHandler:
                         })
                 
                 if info_data:
-                    info_df = pd.DataFrame(info_data)
+                    info_df = DataUtils.records_to_frame(info_data)
                     explanation = "Here's information about the columns you mentioned:"
                     return {
                         "type": "combined",
@@ -460,7 +546,7 @@ class FallbackQueryHandler:
             return {
                 "type": "combined",
                 "text": explanation,
-                "dataframe": pd.DataFrame([summary_stats])
+                "dataframe": DataUtils.records_to_frame([summary_stats])
             }
             
         except Exception as e:
@@ -5,6 +5,7 @@ import numpy as np
 from typing import Dict, Any, List, Optional
 from openai import OpenAI
 from visualization import ChartGenerator
+from utils import DataUtils
 from fallback_query_handler import FallbackQueryHandler
 import re
 
@@ -194,7 +195,7 @@ Respond in JSON format only."""
                     results.append(stats)
             
             if results:
-                results_df = pd.DataFrame(results)
+                results_df = DataUtils.records_to_frame(results)
                 explanation = self._generate_explanation(query, results_df, "summary")
                 
                 return {
@@ -247,24 +248,18 @@ Respond in JSON format only."""
                             filtered_df = filtered_df[filtered_df[age_col] < int(match[3])]
                             condition_applied = True
             
-            # Look for specific value filters
-            for col in self.data_processor.categorical_columns + self.data_processor.binary_columns:
-                col_values = self.data_processor.df[col].dropna().unique()
-                for value in col_values:
-                    if str(value).lower() in query.lower():
-                        filtered_df = filtered_df[filtered_df[col] == value]
-                        condition_applied = True
-                        break
+            # Look for specific value filters; the fallback handler keeps the per-dataframe value index
+            for col, value in self.fallback_handler.find_values_in_query(query.lower()).items():
+                filtered_df = filtered_df[filtered_df[col] == value]
+                condition_applied = True
             
             if condition_applied:
                 count = len(filtered_df)
                 explanation = f"Found {count} records matching your criteria."
                 
                 if count > 0:
-                    # Show first few rows
-                    display_df = filtered_df.head(20)
-                    # Use original column names for display
-                    display_df.columns = [self.data_processor.original_columns.get(col, col) for col in display_df.columns]
+                    # Show first few rows, using original column names for display
+                    display_df = filtered_df.head(20).rename(columns=self.data_processor.original_columns)
                     
                     return {
                         "type": "combined",
@@ -346,9 +341,10 @@ Respond in JSON format only."""
                 }
             
             # Create comparison visualization
-            chart = self.chart_generator.create_comparison_chart(
+            chart = self.chart_generator.create_chart(
                 df=self.data_processor.df,
                 columns=columns,
+                chart_type='comparison',
                 original_columns=self.data_processor.original_columns,
                 column_types=self.data_processor.column_types
             )
@@ -385,7 +381,7 @@ Respond in JSON format only."""
                 }
             
             # Calculate correlation matrix
-            corr_data = self.data_processor.df[numeric_cols].corr()
+            corr_data = self.data_processor.get_correlation_matrix()
             
             # Create correlation heatmap
             chart = self.chart_generator.create_correlation_heatmap(
@@ -34,6 +34,34 @@ def test_load_excel_invalid(tmp_path):
     assert success is False
     assert "Invalid Excel file" in message
 
+def test_load_excel_row_limit(tmp_path):
+    test_file = tmp_path / "large.xlsx"
+    pd.DataFrame({'Value': range(600)}).to_excel(test_file, index=False)
+    
+    processor = DataProcessor()
+    success, message = processor.load_excel(test_file)
+    assert success is False
+    assert "more than 500 rows" in message
+
+def test_infer_column_types(sample_data):
+    processor = DataProcessor()
+    processor.df = sample_data.copy()
+    processor._infer_column_types()
+    assert processor.column_types['Date'] == 'datetime'
+    assert processor.column_types['Price'] == 'numeric'
+    assert processor.column_types['Quantity'] == 'numeric'
+    assert processor.column_types['Product'] == 'categorical'
+
+def test_column_suggestions(tmp_path):
+    test_file = tmp_path / "columns.xlsx"
+    pd.DataFrame({'Unit Price': [1.0], 'Total Prices': [2.0], 'Region': ['East']}).to_excel(test_file, index=False)
+    
+    processor = DataProcessor()
+    processor.load_excel(test_file)
+    assert sorted(processor.get_column_suggestions(['Price'])) == ['total_prices', 'unit_price']
+    assert processor.get_column_suggestions(['unit price']) == ['unit_price']
+    assert processor.get_column_suggestions(['profit']) == []
+
 def test_date_detection(sample_data):
     date_cols = DataUtils.detect_date_columns(sample_data)
     assert 'Date' in date_cols
@@ -48,3 +76,11 @@ def test_column_normalization():
     assert DataUtils.normalize_column_name("total sales", columns) == 'Revenue'
     assert DataUtils.normalize_column_name("average price", columns) == 'Price'
     assert DataUtils.normalize_column_name("unknown", columns) is None
+
+def test_extract_product_name():
+    products = ['Laptop', 'Laptop Pro', 'Phone']
+    products_lower = [p.lower() for p in products]
+    assert DataUtils.extract_product_name("Show all records for Laptops", products, products_lower) == 'Laptop'
+    assert DataUtils.extract_product_name("sales of the laptop pro", products, products_lower) == 'Laptop Pro'
+    assert DataUtils.extract_product_name("PHONE quantity", products) == 'Phone'
+    assert DataUtils.extract_product_name("monitor sales", products, products_lower) is None
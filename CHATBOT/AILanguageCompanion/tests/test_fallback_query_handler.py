@@ -0,0 +1,85 @@
+import pytest
+import pandas as pd
+import numpy as np
+from data_processor import DataProcessor
+from fallback_query_handler import FallbackQueryHandler
+
+def load_handler(tmp_path, data):
+    test_file = tmp_path / "data.xlsx"
+    pd.DataFrame(data).to_excel(test_file, index=False)
+    
+    processor = DataProcessor()
+    success, _ = processor.load_excel(test_file)
+    assert success is True
+    return FallbackQueryHandler(processor)
+
+@pytest.fixture
+def handler(tmp_path):
+    return load_handler(tmp_path, {
+        'Product': ['Phone Case', 'Laptop', 'Phone', 'Monitor', 'Phone'],
+        'Quantity': [2, 5, 10, 8, 3],
+        'Unit Price': [15.0, 900.0, 600.0, 250.0, 650.0],
+        'Region': ['East', 'West', 'East', 'North', 'West']
+    })
+
+@pytest.mark.parametrize("query", [
+    "show a pie chart of region",
+    "plot the line chart trend by product",
+    "histogram of the maximum unit price",
+    "what is the standard deviation of quantity",
+    "records where quantity is greater than 5",
+    "scatter plot of price vs quantity",
+    "box plot comparison between regions",
+    "correlation",
+    "hello there",
+])
+def test_keyword_matching_overlaps(handler, query):
+    # The single scan must agree with testing every keyword separately,
+    # including keywords nested in longer ones ("line" in "line chart", "max" in "maximum")
+    expected_intents = {intent for intent, keywords in handler.INTENT_KEYWORDS.items()
+                        if any(k in query for k in keywords)}
+    expected_chart = next((t for t, keywords in handler.CHART_TYPE_KEYWORDS.items()
+                           if any(k in query for k in keywords)), 'bar')
+    assert handler._match_keywords(query) == (expected_intents, expected_chart)
+
+def test_keyword_matching_intent_and_chart_type(handler):
+    intents, chart_type = handler._match_keywords("show a line chart of the trend by region")
+    assert intents == {'visualization', 'comparison'}
+    assert chart_type == 'line'
+
+def test_column_aliases(handler):
+    # Original, normalized and spaced names all resolve, in order of first mention
+    assert handler._find_columns_in_query("unit price by region") == ['unit_price', 'region']
+    assert handler._find_columns_in_query("average unit_price") == ['unit_price']
+    assert handler._find_columns_in_query("quantity and unit price") == ['quantity', 'unit_price']
+
+def test_first_value_per_column(handler):
+    # 'phone' is inside 'phone case'; the value appearing first in the data wins
+    assert handler.find_values_in_query("phone case sales in west") == {'product': 'Phone Case', 'region': 'West'}
+    assert handler.find_values_in_query("phone sales") == {'product': 'Phone'}
+    # Both regions mentioned: East appears before West in the data
+    assert handler.find_values_in_query("west or east") == {'region': 'East'}
+    assert handler.find_values_in_query("nothing relevant") == {}
+
+def test_age_filter_and_value_filter(tmp_path):
+    people = load_handler(tmp_path, {
+        'Age': [25, 40, np.nan, 35, 50, 30],
+        'Region': ['East', 'East', 'East', 'West', 'East', 'West']
+    })
+    
+    response = people.process_query("records where age under 45 and region east")
+    assert response["type"] == "combined"
+    assert response["dataframe"]["Age"].tolist() == [25, 40]
+    
+    # A missing age never satisfies an age condition
+    response = people.process_query("records where age over 20 and region east")
+    assert response["dataframe"]["Age"].tolist() == [25, 40, 50]
+    
+    response = people.process_query("records where age over 60 and region west")
+    assert response["type"] == "text"
+
+def test_comparison_query(handler):
+    response = handler.process_query("compare region and quantity")
+    assert response["type"] == "chart"
+    assert response["content"].layout.title.text == 'Quantity by Region'
+    assert response["explanation"] == "Comparison of Region and Quantity:"
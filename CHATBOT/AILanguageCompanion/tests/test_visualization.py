@@ -1,5 +1,6 @@
 import pytest
 import pandas as pd
+import numpy as np
 from visualization import ChartGenerator
 from utils import DataUtils
 
@@ -39,3 +40,65 @@ def test_empty_data_handling():
             query="bar chart",
             columns=[]
         )
+
+def test_category_count_chart():
+    chart_gen = ChartGenerator()
+    df = pd.DataFrame({'Region': ['East', 'West', 'East', None, 'North', 'East']})
+    fig = chart_gen._create_smart_default_chart(df, ['Region'])
+    assert list(fig.data[0].x) == ['East', 'West', 'North']
+    assert list(fig.data[0].y) == [3, 1, 1]
+    
+    # Numbers and strings in one column, as DataProcessor leaves them in a category
+    mixed = pd.DataFrame({'Grade': pd.Series([1, 2, 'pending', 'pending', None, 2, 'pending']).astype('category')})
+    fig = chart_gen._create_smart_default_chart(mixed, ['Grade'])
+    assert list(fig.data[0].x) == ['pending', 2, 1]
+    assert list(fig.data[0].y) == [3, 2, 1]
+
+def test_correlation_heatmap():
+    chart_gen = ChartGenerator()
+    corr = pd.DataFrame([[1.0, -0.5], [-0.5, 1.0]], index=['price', 'qty'], columns=['price', 'qty'])
+    fig = chart_gen.create_correlation_heatmap(corr, {'price': 'Price', 'qty': 'Quantity'})
+    assert fig.data[0].type == 'heatmap'
+    assert list(fig.data[0].x) == ['Price', 'Quantity']
+    assert fig.data[0].texttemplate == '%{z:.2f}'
+    assert not fig.layout.annotations
+
+def test_lttb_keeps_endpoints_and_peaks():
+    chart_gen = ChartGenerator()
+    x = np.arange(1000, dtype=float)
+    y = np.zeros(1000)
+    y[500] = 10.0
+    keep = chart_gen._lttb_indices(x, y, 50)
+    assert len(keep) == 50
+    assert keep[0] == 0 and keep[-1] == 999
+    assert 500 in keep
+    assert (np.diff(keep) > 0).all()
+
+def test_chart_type_dispatch():
+    chart_gen = ChartGenerator()
+    df = pd.DataFrame({'region': ['East', 'West', 'East'], 'unit_price': [1.0, 2.0, 3.0]})
+    original_columns = {'region': 'Region', 'unit_price': 'Unit Price'}
+    bar = chart_gen.create_chart(df=df, columns=['region', 'unit_price'], chart_type='bar',
+                                 original_columns=original_columns, column_types={})
+    assert bar.layout.title.text == 'Unit Price by Region'
+    pie = chart_gen.create_chart(df=df, columns=['region'], chart_type='PIE')
+    assert pie.data[0].type == 'pie'
+    other = chart_gen.create_chart(df=df, columns=['unit_price'], chart_type='histogram')
+    assert other.data[0].type == 'histogram'
+
+def test_create_charts_batch():
+    chart_gen = ChartGenerator()
+    df = pd.DataFrame({
+        'region': ['East', 'West', 'East'],
+        'unit_price': [1.0, 2.0, 3.0],
+        'order_date': pd.date_range('2024-01-01', periods=3)
+    })
+    figs = chart_gen.create_charts(
+        df,
+        [(['region', 'unit_price'], 'bar'), (['region'], 'pie'), (['order_date', 'unit_price'], 'line'), (['missing'], 'bar')],
+        original_columns={'region': 'Region', 'unit_price': 'Unit Price'}
+    )
+    assert figs[0].layout.title.text == 'Unit Price by Region'
+    assert figs[1].data[0].type == 'pie'
+    assert figs[2].layout.title.text == 'Unit Price over Time'
+    assert figs[3] is None
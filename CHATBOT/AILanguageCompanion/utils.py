@@ -31,6 +31,25 @@ class DataUtils:
         
         return None
 
+    @staticmethod
+    def extract_product_name(query: str, products: List[str],
+                             products_lower: Optional[List[str]] = None) -> Optional[str]:
+        """Find the product mentioned in a query.
+        
+        Pass products_lower (the lowercased product names, aligned with products)
+        to avoid re-lowercasing the whole list on every call.
+        """
+        query = query.lower()
+        if products_lower is None:
+            products_lower = [str(p).lower() for p in products]
+        
+        # Prefer the longest mentioned name so "Laptop Pro" wins over "Laptop"
+        best = None
+        for i, name in enumerate(products_lower):
+            if name and name in query and (best is None or len(name) > len(products_lower[best])):
+                best = i
+        return products[best] if best is not None else None
+
     @staticmethod
     def detect_date_columns(df: pd.DataFrame) -> List[str]:
         """Identify potential date columns"""
@@ -83,6 +102,11 @@ class DataUtils:
             return False
         return True
 
+    @staticmethod
+    def records_to_frame(records: List[Dict]) -> pd.DataFrame:
+        """Build a result table from row dicts with Arrow-backed columns"""
+        return pd.DataFrame.from_records(records).convert_dtypes(dtype_backend='pyarrow')
+
     @staticmethod
     def get_column_stats(df: pd.DataFrame, column: str) -> Dict[str, Union[str, float]]:
         """Generate statistics for a specific column"""
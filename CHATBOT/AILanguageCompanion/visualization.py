@@ -1,59 +1,143 @@
+import functools
+import logging
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 import pandas as pd
-from typing import List, Dict, Optional
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from typing import List, Dict, Optional, Tuple
 from utils import DataUtils
+from config import Config
+
+# Shared chart styling, registered once so figures inherit it instead of re-validating it per chart
+_TEMPLATE = go.layout.Template(pio.templates[Config.DEFAULT_CHART_THEME])
+_TEMPLATE.layout.font = Config.CHART_CONFIG['font']
+_TEMPLATE.layout.title.font.size = 16
+pio.templates['chatbot_default'] = _TEMPLATE
+pio.templates.default = 'chatbot_default'
+
+logger = logging.getLogger(__name__)
+
+def _safe_chart(build):
+    """Log and swallow chart-building errors, returning None so callers can show a message instead."""
+    @functools.wraps(build)
+    def wrapper(*args, **kwargs):
+        try:
+            return build(*args, **kwargs)
+        except Exception as e:
+            logger.warning("Chart generation error in %s: %s", build.__name__, e)
+            return None
+    return wrapper
 
 class ChartGenerator:
+    # Series longer than this are downsampled to LINE_POINTS before plotting
+    LINE_DOWNSAMPLE_THRESHOLD = 20_000
+    LINE_POINTS = 5_000
+    
+    # Columns the revenue pie and quantity bar read besides the requested ones
+    SALES_COLUMNS = ('Product', 'Price', 'Quantity')
+    
+    # Explicit chart types and the builder each maps to; other types get the default chart
+    CHART_BUILDERS = (
+        (('bar', 'column', 'compare', 'comparison'), '_create_comparison_chart'),
+        (('pie',), '_create_distribution_pie'),
+        (('line', 'time', 'time_series', 'trend'), '_create_trend_chart'),
+    )
+    
     def __init__(self):
         self.utils = DataUtils()
         self.colors = px.colors.qualitative.Plotly
+        self._dispatch = {alias: getattr(self, method)
+                          for aliases, method in self.CHART_BUILDERS for alias in aliases}
 
-    def create_chart(self, df: pd.DataFrame, query: str, columns: List[str]) -> Optional[go.Figure]:
-        """Main method to create appropriate chart based on query."""
-        try:
-            df = self.utils.calculate_revenue(df.copy())
-            query = self.utils.normalize_query(query)
-            
-            # Handle specific chart requests
-            if "pie" in query and "revenue" in query:
-                return self._create_pie_chart(df, 'Product', 'Revenue', 'Revenue Share by Product')
-            
-            if "pie" in query:
-                col = self._find_best_column(df, columns, ['Product', 'Category', 'Type'])
-                if col:
-                    return self._create_pie_chart(df, col, None, f'Distribution of {col}')
-            
-            if "bar" in query or "compare" in query:
-                if "region" in query or "region" in [c.lower() for c in columns]:
-                    region_col = next((c for c in columns if "region" in c.lower()), columns[0])
-                    return self._create_bar_chart(df, region_col, 'Quantity', f'Quantity by {region_col}')
-                return self._create_comparison_chart(df, columns)
-            
-            if "time" in query or "date" in query:
-                date_col = next((c for c in columns if "date" in c.lower()), None)
-                if date_col:
-                    return self._create_time_series(df, date_col, self._find_numeric_column(df, columns))
-            
-            # Default to showing first categorical vs numeric columns
-            return self._create_smart_default_chart(df, columns)
+    @_safe_chart
+    def create_chart(self, df: pd.DataFrame, query: str = "", columns: List[str] = None,
+                     chart_type: str = None, original_columns: Dict[str, str] = None,
+                     column_types: Dict[str, str] = None) -> Optional[go.Figure]:
+        """
+        Main method to create appropriate chart based on query.
         
-        except Exception as e:
-            print(f"Chart generation error: {str(e)}")
-            return None
+        An explicit chart_type is dispatched directly; otherwise the query's wording
+        picks the chart. original_columns relabels normalized columns for display.
+        column_types is accepted from the query handlers but not needed: DataProcessor
+        has already converted its datetime columns, which the dtype checks pick up.
+        """
+        columns = list(columns or [])
+        df = self._project(df, columns)
+        
+        if original_columns:
+            df = df.rename(columns=original_columns)
+            columns = [original_columns.get(c, c) for c in columns]
+        
+        if chart_type:
+            build = self._dispatch.get(chart_type.lower(), self._create_smart_default_chart)
+            chart_df = self.utils.calculate_revenue(df.reset_index(drop=True))
+            return build(chart_df, columns) or self._create_smart_default_chart(chart_df, columns)
+        return self._build_chart(df, query, columns)
+
+    def create_charts(self, df: pd.DataFrame, requests: List[Tuple[List[str], str]],
+                      original_columns: Dict[str, str] = None,
+                      column_types: Dict[str, str] = None) -> List[Optional[go.Figure]]:
+        """
+        Create a chart for each (columns, chart_type) request, narrowing df once
+        to the union of the requested columns instead of once per chart.
+        """
+        shared = self._project(df, [col for columns, _ in requests for col in columns])
+        return [self.create_chart(shared, columns=columns, chart_type=chart_type,
+                                  original_columns=original_columns, column_types=column_types)
+                for columns, chart_type in requests]
+
+    def _project(self, df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+        """
+        Narrow df to the columns a chart can read: the requested ones plus the sales
+        columns, so wide uploads aren't copied whole.
+        """
+        needed = [c for c in dict.fromkeys([*columns, *self.SALES_COLUMNS]) if c in df.columns]
+        return df[needed]
+
+    def _build_chart(self, df: pd.DataFrame, query: str, columns: List[str]) -> Optional[go.Figure]:
+        """Pick and build the chart for a query."""
+        df = self.utils.calculate_revenue(df.reset_index(drop=True))
+        query = self.utils.normalize_query(query)
+        
+        # Handle specific chart requests
+        if "pie" in query and "revenue" in query:
+            return self._create_pie_chart(df, 'Product', 'Revenue', 'Revenue Share by Product')
+        
+        if "pie" in query:
+            fig = self._dispatch['pie'](df, columns)
+            if fig:
+                return fig
+        
+        if "bar" in query or "compare" in query:
+            if "region" in query or "region" in [c.lower() for c in columns]:
+                region_col = next((c for c in columns if "region" in c.lower()), columns[0])
+                return self._create_bar_chart(df, region_col, 'Quantity', f'Quantity by {region_col}')
+            return self._dispatch['bar'](df, columns)
+        
+        if "time" in query or "date" in query:
+            fig = self._dispatch['time'](df, columns)
+            if fig:
+                return fig
+        
+        # Default to showing first categorical vs numeric columns
+        return self._create_smart_default_chart(df, columns)
 
     def _create_pie_chart(self, df: pd.DataFrame, names_col: str, values_col: str = None, 
                          title: str = None) -> go.Figure:
         """Create a pie chart."""
+        # Single-series traces are built directly, skipping Plotly Express' long-form reshaping
         if values_col:
-            fig = px.pie(df, names=names_col, values=values_col, title=title)
+            labels, values = df[names_col], df[values_col]
         else:
-            counts = df[names_col].value_counts().reset_index()
-            counts.columns = [names_col, 'count']
-            fig = px.pie(counts, names=names_col, values='count', title=title)
+            counts = self._value_counts(df[names_col])
+            labels, values = counts[names_col], counts['count']
         
-        fig.update_traces(textposition='inside', textinfo='percent+label')
-        fig.update_layout(uniformtext_minsize=12, uniformtext_mode='hide')
+        fig = go.Figure(go.Pie(labels=labels, values=values, name=names_col,
+                               textposition='inside', textinfo='percent+label'))
+        fig.update_layout(title=title, uniformtext_minsize=12, uniformtext_mode='hide')
         return fig
 
     def _create_bar_chart(self, df: pd.DataFrame, x_col: str, y_col: str, title: str) -> go.Figure:
@@ -62,42 +146,110 @@ class ChartGenerator:
         fig.update_layout(xaxis_title=x_col, yaxis_title=y_col)
         return fig
 
+    def _create_distribution_pie(self, df: pd.DataFrame, columns: List[str]) -> Optional[go.Figure]:
+        """Create a pie chart of the best categorical column's values."""
+        col = self._find_best_column(df, columns, ['Product', 'Category', 'Type'])
+        if not col:
+            return None
+        return self._create_pie_chart(df, col, None, f'Distribution of {col}')
+
+    def _create_trend_chart(self, df: pd.DataFrame, columns: List[str]) -> Optional[go.Figure]:
+        """Create a time series from the first date column and first numeric column."""
+        date_col = next((c for c in columns if pd.api.types.is_datetime64_any_dtype(df[c].dtype)
+                         or "date" in c.lower()), None)
+        value_col = self._find_numeric_column(df, [c for c in columns if c != date_col])
+        if not date_col or not value_col:
+            return None
+        return self._create_time_series(df, date_col, value_col)
+
     def _create_time_series(self, df: pd.DataFrame, date_col: str, value_col: str) -> go.Figure:
         """Create a time series line chart."""
         df[date_col] = pd.to_datetime(df[date_col])
-        df = df.sort_values(date_col)
+        # Dates usually arrive in order; only sort when they don't
+        if not df[date_col].is_monotonic_increasing:
+            df = df.sort_values(date_col)
+        df[value_col] = self._to_plot_dtype(df[value_col])
+        if len(df) > self.LINE_DOWNSAMPLE_THRESHOLD:
+            df = df.dropna(subset=[date_col, value_col])
+            x = df[date_col].to_numpy().astype(np.int64).astype(np.float64)
+            df = df.iloc[self._lttb_indices(x, df[value_col].to_numpy(np.float64), self.LINE_POINTS)]
+        # Long series render through WebGL instead of one SVG node per point
         fig = px.line(df, x=date_col, y=value_col, 
-                     title=f'{value_col} over Time')
+                     title=f'{value_col} over Time',
+                     render_mode='webgl' if len(df) > 1000 else 'svg')
         fig.update_xaxes(title='Date')
         fig.update_yaxes(title=value_col)
         return fig
 
+    def _lttb_indices(self, x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+        """
+        Largest-Triangle-Three-Buckets: pick n_out points that keep the line's shape.
+        Keeps the first and last point, and from each bucket in between the point
+        forming the largest triangle with the previous pick and the next bucket's mean.
+        """
+        n = len(x)
+        if n <= n_out or n_out < 3:
+            return np.arange(n)
+        
+        edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+        keep = np.empty(n_out, dtype=np.int64)
+        keep[0], keep[-1] = 0, n - 1
+        a = 0
+        for i in range(n_out - 2):
+            lo, hi = edges[i], edges[i + 1]
+            next_hi = edges[i + 2] if i + 2 < len(edges) else n
+            mean_x, mean_y = x[hi:next_hi].mean(), y[hi:next_hi].mean()
+            area = np.abs((x[a] - mean_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (mean_y - y[a]))
+            a = lo + int(np.argmax(area))
+            keep[i + 1] = a
+        return keep
+
     def _create_comparison_chart(self, df: pd.DataFrame, columns: List[str]) -> go.Figure:
         """Create a comparison chart between columns."""
-        numeric_cols = [c for c in columns if pd.api.types.is_numeric_dtype(df[c])]
-        cat_cols = [c for c in columns if not pd.api.types.is_numeric_dtype(df[c])]
+        numeric_cols, cat_cols = self._split_columns(df, columns)
         
         if numeric_cols and cat_cols:
             # Compare numeric across categories
+            df = df.assign(**{numeric_cols[0]: self._to_plot_dtype(df[numeric_cols[0]])})
             return px.bar(df, x=cat_cols[0], y=numeric_cols[0], color=cat_cols[0],
                          title=f'{numeric_cols[0]} by {cat_cols[0]}')
         elif len(numeric_cols) >= 2:
             # Compare multiple numeric columns
-            return px.bar(df[numeric_cols].mean().reset_index(), 
-                         x='index', y=0, title='Comparison of Metrics')
-        else:
+            means = df[numeric_cols].mean()
+            fig = go.Figure(go.Bar(x=means.index, y=means.to_numpy()))
+            fig.update_layout(title='Comparison of Metrics')
+            return fig
+        elif cat_cols:
             # Show value counts for categorical data
-            return px.bar(df[cat_cols[0]].value_counts().reset_index(),
-                         x='index', y=cat_cols[0], title=f'Count by {cat_cols[0]}')
+            return self._create_count_chart(df[cat_cols[0]])
+        else:
+            # A single numeric column has nothing to compare against; show its distribution
+            return self._create_smart_default_chart(df, numeric_cols)
+
+    @_safe_chart
+    def create_correlation_heatmap(self, correlation_matrix: pd.DataFrame,
+                                   original_columns: Dict[str, str] = None) -> Optional[go.Figure]:
+        """Create a heatmap of a correlation matrix, labelled with original column names."""
+        if correlation_matrix is None or correlation_matrix.empty:
+            return None
+        
+        labels = [(original_columns or {}).get(c, c) for c in correlation_matrix.columns]
+        # Plotly.js formats the cell text and picks a contrasting colour per cell
+        fig = px.imshow(correlation_matrix.to_numpy(), x=labels, y=labels,
+                        text_auto='.2f', zmin=-1, zmax=1,
+                        color_continuous_scale='RdBu_r', title='Correlation Matrix')
+        return fig
 
     def _create_smart_default_chart(self, df: pd.DataFrame, columns: List[str]) -> go.Figure:
         """Create a sensible default chart based on data types."""
-        numeric_cols = [c for c in columns if pd.api.types.is_numeric_dtype(df[c])]
-        cat_cols = [c for c in columns if not pd.api.types.is_numeric_dtype(df[c])]
+        numeric_cols, cat_cols = self._split_columns(df, columns)
         
         if not numeric_cols and not cat_cols:
             return None
             
+        if numeric_cols:
+            df = df.assign(**{numeric_cols[0]: self._to_plot_dtype(df[numeric_cols[0]])})
+        
         if numeric_cols and cat_cols:
             # Show relationship between categorical and numeric
             return px.box(df, x=cat_cols[0], y=numeric_cols[0],
@@ -108,9 +260,39 @@ class ChartGenerator:
                               title=f'Distribution of {numeric_cols[0]}')
         else:
             # Show value counts for categorical data
-            return px.bar(df[cat_cols[0]].value_counts().reset_index(),
-                         x='index', y=cat_cols[0],
-                         title=f'Count by {cat_cols[0]}')
+            return self._create_count_chart(df[cat_cols[0]])
+
+    def _create_count_chart(self, series: pd.Series) -> go.Figure:
+        """Create a bar chart of how often each value occurs."""
+        counts = self._value_counts(series)
+        fig = go.Figure(go.Bar(x=counts[series.name], y=counts['count']))
+        fig.update_layout(title=f'Count by {series.name}', xaxis_title=series.name, yaxis_title='count')
+        return fig
+
+    def _to_plot_dtype(self, series: pd.Series) -> pd.Series:
+        """Narrow float64 values to float32, halving the bytes each plotted point ships."""
+        if series.dtype == np.float64:
+            return series.astype(np.float32)
+        return series
+
+    def _value_counts(self, series: pd.Series) -> pd.DataFrame:
+        """Count each value with Arrow's hash kernel, most frequent first."""
+        try:
+            values = pc.drop_null(pa.Array.from_pandas(series))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Columns mixing numbers and strings have no single Arrow type; let pandas count them
+            counts = series.value_counts()
+            counts = counts[counts > 0]  # Unused categories aren't plotted
+            return pd.DataFrame({series.name: counts.index.to_numpy(), 'count': counts.to_numpy()})
+        if pa.types.is_dictionary(values.type):
+            values = values.dictionary_decode()
+        counts = pc.value_counts(values)
+        order = pc.sort_indices(counts.field('counts'), sort_keys=[('', 'descending')])
+        counts = counts.take(order)
+        return pd.DataFrame({
+            series.name: counts.field('values').to_pandas(),
+            'count': counts.field('counts').to_numpy()
+        })
 
     def _find_best_column(self, df: pd.DataFrame, columns: List[str], 
                          preferred: List[str] = None) -> Optional[str]:
@@ -123,7 +305,15 @@ class ChartGenerator:
 
     def _find_numeric_column(self, df: pd.DataFrame, columns: List[str]) -> Optional[str]:
         """Find the first numeric column."""
+        numeric_cols, _ = self._split_columns(df, columns)
+        return numeric_cols[0] if numeric_cols else None
+
+    def _split_columns(self, df: pd.DataFrame, columns: List[str]) -> Tuple[List[str], List[str]]:
+        """Split columns into (numeric, categorical), checking each dtype once."""
+        numeric_cols, cat_cols = [], []
         for col in columns:
-            if pd.api.types.is_numeric_dtype(df[col]):
-                return col
-        return None
+            if pd.api.types.is_numeric_dtype(df[col].dtype):
+                numeric_cols.append(col)
+            else:
+                cat_cols.append(col)
+        return numeric_cols, cat_cols